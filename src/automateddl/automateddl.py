@@ -1,178 +1,310 @@
 import aria2p
+import errno
+import glob
+import io
+import logging
 import os
 import pathlib
 import patoolib
 import shutil
 import re
-import datetime
-import threading
+import subprocess
+import zipfile
+import concurrent.futures
 
 from .lockbykey import LockByKey
 
-class AutomatedDL:
-    __api = aria2p.API
+logger = logging.getLogger(__name__)
+
+# Multipart naming schemes, completed with the archive extension and
+# compiled once per extension in _multipartPatterns
+_multipartRegEx = [r'^(?P<filename>.+)\.part(?P<number>\d+)\.']
+_multipartPatterns = {}
 
-    __extractpath = str
-    __endedpath = str
-    __downpath = str
+# extension-agnostic variant used to bucket a downloads list by archive base
+_multipartBaseRegEx = re.compile(r'^(?P<filename>.+)\.part(?P<number>\d+)\.\w+$')
 
-    __threadlist = {}
+def _group_by_base(dls):
+    groups = {}
+    for dl in dls:
+        m = _multipartBaseRegEx.match(dl.name)
+        base = m.group('filename') if m else dl.name
+        groups.setdefault(base, []).append(dl)
+    return groups
 
-    __lockbykey = LockByKey()
+_archiveExt = frozenset(('.zip', '.rar'))
 
-    #__lock = threading.Lock()
+# keep alphanumerics (\w also covers '_') plus '.', drop everything else
+_sanitizeRegEx = re.compile(r'[^\w.]')
 
+_sevenzip = shutil.which('7z')
+_unrar = shutil.which('unrar')
+
+class AutomatedDL:
     outSuffix = '-OUT'
 
     def Move(self, path: pathlib.Path, dest: str):
-        to_directory = pathlib.Path(dest)
+        if dest not in self.__createddirs:
+            # raises FileExistsError when target is already a file
+            os.makedirs(dest, exist_ok=True)
+            self.__createddirs.add(dest)
+
+        target = os.path.join(dest, os.path.basename(str(path)))
+
+        try:
+            # same filesystem: a single atomic, zero-copy rename
+            os.replace(str(path), target)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            shutil.move(str(path), target)
+
+    def Extract(self, path: str, outDir: str):
+        lower = path.lower()
+
+        if lower.endswith('.rar') and _unrar is not None:
+            # straight to the codec, skipping patool's per-call format
+            # re-detection and wrapper layer
+            subprocess.run([_unrar, 'x', '-y', '-o+', '-inul', path, outDir + os.sep],
+                check=True)
+        elif lower.endswith('.zip'):
+            if _sevenzip is not None:
+                # decompressing out of process keeps the interpreter free
+                # for the other workers, zipfile would hold the GIL
+                subprocess.run([_sevenzip, 'x', '-y', '-bd', '-o' + outDir, path],
+                    check=True, stdout=subprocess.DEVNULL)
+            else:
+                # Go through zipfile directly with a large read buffer, the
+                # external tools patool falls back on use tiny I/O buffers
+                with zipfile.ZipFile(io.BufferedReader(open(path, 'rb'), buffer_size=4 * 1024 * 1024)) as archive:
+                    archive.extractall(outDir)
+        else:
+            # patool already dispatches rars to an external unrar/7z
+            patoolib.extract_archive(path, outdir=outDir)
 
-        # raises FileExistsError when target is already a file
-        to_directory.mkdir(parents=True, exist_ok=True)
+    def Prefetch(self, path: str):
+        # warm the page cache with this part so the extractor reads it
+        # from memory once the last volume lands
+        if not hasattr(os, 'posix_fadvise'):
+            return
 
-        shutil.move(str(path), str(to_directory))
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
 
-    def HandleArchive(self, gid:str, path: pathlib.Path, lockbase: str):
+    def HandleArchive(self, gid:str, path: str, lockbase: str, partnames: list = None):
 
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " " + gid + " HandleArchive")
+        logger.info("%s HandleArchive", gid)
         
-        keepcharacters = ('.','_')
-        safeLockbase = "".join(c for c in lockbase if c.isalnum() or c in keepcharacters).rstrip()
-        
-        baseName = os.path.join(self.__extractpath, safeLockbase)
+        safeLockbase = _sanitizeRegEx.sub('', lockbase).rstrip()
+
+        if self.__stageextract:
+            baseName = os.path.join(self.__extractpath, safeLockbase)
+        else:
+            baseName = os.path.join(self.__endedpath, safeLockbase)
 
-        outDir = pathlib.Path(baseName+self.outSuffix)
+        outDir = baseName + self.outSuffix
 
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " " + gid + " Acquitre Lock " + safeLockbase)
+        logger.info("%s Acquitre Lock %s", gid, safeLockbase)
         
         lock = self.__lockbykey.getlock(safeLockbase)
 
-        if not lock.locked() and lock.acquire(timeout=5):
+        # acquire() alone decides, a locked() pre-check would race anyway
+        if lock.acquire(timeout=5):
 
             try:
-                if path.exists():
-
-                    outDir.mkdir(parents=True, exist_ok=True)
-
-                    print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " " + gid + " Extract")
+                if os.path.exists(path):
 
+                    # __extractpath itself is guaranteed by __init__, a
+                    # single mkdir is enough
                     try:
-                        patoolib.extract_archive(str(path), outdir=outDir)
-                
-                        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " " + gid + " Move")
-                        self.Move(outDir, self.__endedpath)
-
-                        filetoremove = list(filter(lambda dir: dir.is_file() and dir.name.startswith(lockbase), 
-                            pathlib.Path(self.__downpath).iterdir()))
+                        os.mkdir(outDir)
+                    except FileExistsError:
+                        pass
 
-                        for file in filetoremove:
-                            print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " " + gid + " Clean " + file.name)
-                            os.remove(str(file))
+                    logger.info("%s Extract", gid)
 
-                    except patoolib.util.PatoolError as inst:
-                        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " " + gid + " Error " + str(inst))
+                    try:
+                        self.Extract(path, outDir)
+
+                        if self.__stageextract:
+                            logger.info("%s Move", gid)
+                            self.Move(outDir, self.__endedpath)
+
+                        # aria2's snapshot can miss sibling parts whose
+                        # downloads were already purged by their own
+                        # completion events, union it with a prefix scan
+                        names = set(partnames) if partnames is not None else set()
+                        for file in glob.iglob(os.path.join(self.__downpath, glob.escape(lockbase) + '*')):
+                            names.add(os.path.basename(file))
+                        for name in names:
+                            logger.info("%s Clean %s", gid, name)
+                            try:
+                                os.remove(os.path.join(self.__downpath, name))
+                            except FileNotFoundError:
+                                pass
+                            except OSError as err:
+                                # directories are not ours to clean
+                                logger.warning("%s Clean failed %s", gid, err)
+
+                    except (patoolib.util.PatoolError, zipfile.BadZipFile, subprocess.CalledProcessError) as inst:
+                        logger.error("%s Error %s", gid, inst)
 
                 else:
-                    print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " " + gid + " Missing file")
+                    logger.info("%s Missing file", gid)
 
 
             finally:
-                print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " " + gid + " Lock Release")
+                logger.info("%s Lock Release", gid)
                 lock.release()
                 self.__lockbykey.delete(safeLockbase)
 
 
         else:
-            print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " " + gid + " Already Locked")
+            logger.info("%s Already Locked", gid)
 
-    def HandleMultiPart(self, gid:str, api: aria2p.API, path: pathlib.Path, ext: str):
-        multipartRegEx = [r'^(?P<filename>.+)\.part(?P<number>\d+)\.']
+    def HandleMultiPart(self, gid:str, api: aria2p.API, path: str, ext: str, parts: dict = None):
         doExtract = False
         isMatched = False
-        filename = path.name
+        filename = os.path.basename(path)
+        partnames = None
 
-        for regex in multipartRegEx:
-            m = re.match(regex + ext[1:] + '$', filename)
+        patterns = _multipartPatterns.get(ext)
+        if patterns is None:
+            patterns = [re.compile(regex + re.escape(ext[1:]) + '$') for regex in _multipartRegEx]
+            _multipartPatterns[ext] = patterns
+
+        for pattern in patterns:
+            m = pattern.match(filename)
 
             if (m != None):
                 isMatched = True
-                groupNumber = m.group('number')
-                if groupNumber.isnumeric:
-                    dls = api.get_downloads()
+                if m.group('number').isdigit():
+                    if parts is None:
+                        parts = _group_by_base(api.get_downloads())
 
-                    filterdDls = list(
-                        filter(lambda download: download.name.startswith(m.group('filename')), dls))
+                    prefix = m.group('filename')
 
-                    if all(e.is_complete for e in filterdDls):
+                    # all() bails out on the first incomplete part
+                    if all(d.is_complete for d in parts.get(prefix, ())):
                         doExtract = True
-                        filename = m.group('filename')
+                        filename = prefix
+                        partnames = [d.name for d in parts.get(prefix, ())]
                         break  # We have all the necessary data
 
         if not isMatched or doExtract:
-            self.HandleArchive(gid, path, filename)
+            self.HandleArchive(gid, path, filename, partnames)
+        else:
+            # sibling parts are still downloading, overlap their transfer
+            # with readahead of this finished one
+            self.Prefetch(path)
 
-    def HandleDownload(self, api: aria2p.API, dl: aria2p.Download, path: pathlib.Path):
+    def HandleDownload(self, api: aria2p.API, dl: aria2p.Download, path: str, parts: dict = None):
 
-        path = pathlib.Path(os.path.join(self.__downpath, path.name))
-        
-        archiveExt = ['.zip', '.rar']
+        # stay on plain strings here, Path objects are only built where
+        # they are really needed
+        name = os.path.basename(path)
+        path = os.path.join(self.__downpath, name)
 
-        _, file_extension = os.path.splitext(path)
-        if file_extension == ".nfo":
-            # API + RemoveApi/DeleteApi
-            api.remove(downloads=[dl], files=True, clean=True)
+        # one slice instead of the posixpath splitext walk, lowercased so
+        # .RAR and friends take the archive branch too
+        dot = name.rfind('.')
+        file_extension = name[dot:].lower() if dot > 0 else ''
 
-        elif any(file_extension == ext for ext in archiveExt):
-            # Extract -> MoveFs -> RemoveApi
-            self.HandleMultiPart(dl.gid, api, path, file_extension)
-            api.remove(downloads=[dl], clean=True)
-        else:
-            # MoveFs and RemoveApi
-            self.Move(path, self.__endedpath)
-            api.remove(downloads=[dl], clean=True)
+        handler = self.__handlers.get(file_extension, self.HandleMove)
+        handler(api, dl, path, file_extension, parts)
+
+    def HandleNfo(self, api: aria2p.API, dl: aria2p.Download, path: str, ext: str, parts: dict = None):
+        # API + RemoveApi/DeleteApi
+        api.remove(downloads=[dl], files=True, clean=True)
+
+    def HandleArchiveFile(self, api: aria2p.API, dl: aria2p.Download, path: str, ext: str, parts: dict = None):
+        # Extract -> MoveFs -> RemoveApi
+        self.HandleMultiPart(dl.gid, api, path, ext, parts)
+        api.remove(downloads=[dl], clean=True)
+
+    def HandleMove(self, api: aria2p.API, dl: aria2p.Download, path: str, ext: str, parts: dict = None):
+        # MoveFs and RemoveApi
+        self.Move(path, self.__endedpath)
+        api.remove(downloads=[dl], clean=True)
 
     def on_complete_thread(self, api: aria2p.API, gid: str):
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " " + gid + " OnComplete")
+        logger.info("%s OnComplete", gid)
 
         dl = api.get_download(gid)
 
-        for file in dl.files:
-            self.HandleDownload(api, dl, file.path)
+        # one RPC round-trip for the whole completion event, bucketed so
+        # the multipart check is a dict probe per file
+        parts = _group_by_base(api.get_downloads())
 
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " " + gid + " Complete")
+        # Independent files can extract concurrently, LockByKey already
+        # guards same-archive races
+        tasks = [self.__pool.submit(self.HandleDownload, api, dl, str(file.path), parts) for file in dl.files]
+        for task in concurrent.futures.as_completed(tasks):
+            try:
+                task.result()
+            except Exception:
+                # surface handler failures here: the enclosing future's
+                # result is never retrieved, so a re-raise would vanish
+                logger.exception("%s Handler error", gid)
 
+        logger.info("%s Complete", gid)
 
-    def on_complete(self, api: aria2p.API, gid: str):
 
-        kwargs = {
-            "api": api,
-            "gid": gid,
-        }
+    def on_complete(self, api: aria2p.API, gid: str):
+        task = self.__executor.submit(self.on_complete_thread, api, gid)
 
-        self.__threadlist[gid] = threading.Thread(target=self.on_complete_thread, kwargs=kwargs)
-        self.__threadlist[gid].start()
+        # only live futures are retained, each one prunes itself when done
+        self.__futures.add(task)
+        task.add_done_callback(self.__futures.discard)
 
 
-    def __init__(self, api: aria2p.API, downpath: str, extractpath: str, endedpath: str):
+    def __init__(self, api: aria2p.API, downpath, extractpath, endedpath):
+        # paths may be str or os.PathLike, normalised to str once here
+        # so the hot path handlers never re-convert
         self.__api = api
-        self.__downpath = downpath
-        self.__extractpath = extractpath
-        self.__endedpath = endedpath
+        self.__downpath = os.fspath(downpath)
+        self.__extractpath = os.fspath(extractpath)
+        self.__endedpath = os.fspath(endedpath)
+
+        # completion events and per-file work run on separate pools so a
+        # waiting event worker can never starve its own file tasks
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(4, os.cpu_count() or 1))
+        self.__futures = set()
+
+        self.__pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self.__createddirs = set()
+        self.__lockbykey = LockByKey()
+
+        # extension dispatch table, HandleMove is the default
+        self.__handlers = {'.nfo': self.HandleNfo}
+        for ext in _archiveExt:
+            self.__handlers[ext] = self.HandleArchiveFile
 
         pathlib.Path(downpath).mkdir(parents=True, exist_ok=True)
         pathlib.Path(extractpath).mkdir(parents=True, exist_ok=True)
         pathlib.Path(endedpath).mkdir(parents=True, exist_ok=True)
 
+        # staging only pays off when the final Move is a rename; on a
+        # cross-device layout extract straight into endedpath instead of
+        # copying the whole tree a second time
+        self.__stageextract = os.stat(extractpath).st_dev == os.stat(endedpath).st_dev
+
     def start(self):
         self.__api.listen_to_notifications(
             threaded=True, on_download_complete=self.on_complete)
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " Starting listenning")
+        logger.info("Starting listenning")
 
     def stop(self):
         self.__api.stop_listening()
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " Stop listenning")
+        logger.info("Stop listenning")
 
-        for th in self.__threadlist.values():
-            th.join()
+        self.__executor.shutdown(wait=True)
+        self.__pool.shutdown(wait=True)
 
-        print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") + " Stop thread")
+        logger.info("Stop thread")
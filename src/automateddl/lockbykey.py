@@ -1,16 +1,29 @@
 import threading
 
 class LockByKey:
-    __locks = dict()
-    __selfLock = threading.Lock()
+    # power of two so the shard index is a plain mask of the key hash
+    shards = 16
+
+    def __init__(self):
+        self.__locks = [dict() for _ in range(self.shards)]
+        self.__selfLocks = [threading.Lock() for _ in range(self.shards)]
+
+    def __shard(self, key: str) -> int:
+        return hash(key) & (self.shards - 1)
 
     def getlock(self, key: str) -> threading.Lock:
-        with self.__selfLock:
-            if not key in self.__locks.keys():
-                self.__locks[key] = threading.Lock()
-            return self.__locks[key]
+        locks = self.__locks[self.__shard(key)]
+
+        # lock-free fast path: single dict reads are atomic under the GIL
+        lock = locks.get(key)
+        if lock is not None:
+            return lock
+
+        with self.__selfLocks[self.__shard(key)]:
+            if key not in locks:
+                locks[key] = threading.Lock()
+            return locks[key]
 
     def delete(self, key: str):
-        with self.__selfLock:
-            if key in self.__locks.keys():
-                del self.__locks[key]
+        with self.__selfLocks[self.__shard(key)]:
+            self.__locks[self.__shard(key)].pop(key, None)
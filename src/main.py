@@ -1,42 +1,75 @@
-import aria2p
+import logging
 import os
 import signal
 import sys
-import datetime
+from dataclasses import dataclass
 
-import automateddl
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(message)s',
+    datefmt='%Y/%m/%dT%H:%M:%S')
 
-# Get Config fom environnement
+logger = logging.getLogger(__name__)
 
-server = os.getenv('SERVER', 'http://127.0.0.1')
-port = os.getenv('PORT', '6800')
-secret = os.getenv('SECRET', '')
+# Get Config fom environnement, read once and frozen
 
-downloaddir = os.getenv('DOWNLOADDIR', '/downloads')
-extractdir = os.getenv('EXRACTDIR', '/downloads/Extract')
-endeddir = os.getenv('ENDEDDIR', '/downloads/Ended')
+@dataclass(frozen=True)
+class Config:
+    server: str
+    port: int
+    secret: str
+    downloaddir: str
+    extractdir: str
+    endeddir: str
 
-print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " Server: " + server)
-print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " Port: " + port)
+env = os.environ
+cfg = Config(
+    server=env.get('SERVER', 'http://127.0.0.1'),
+    port=int(env.get('PORT', '6800')),
+    secret=env.get('SECRET', ''),
+    downloaddir=env.get('DOWNLOADDIR', '/downloads'),
+    extractdir=env.get('EXRACTDIR', '/downloads/Extract'),
+    endeddir=env.get('ENDEDDIR', '/downloads/Ended'),
+)
 
-print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " downloaddir: " + downloaddir)
-print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " extractdir: " + extractdir)
-print(datetime.datetime.now().strftime("%Y/%m/%dT%H:%M:%S.%f") +  " endeddir: " + endeddir)
+logger.info("Server: %s", cfg.server)
+logger.info("Port: %s", cfg.port)
+
+logger.info("downloaddir: %s", cfg.downloaddir)
+logger.info("extractdir: %s", cfg.extractdir)
+logger.info("endeddir: %s", cfg.endeddir)
+
+# deferred so a bad config or early SIGINT doesn't pay for the full
+# aria2p/patool import graph first
+import aria2p
+
+import automateddl
 
 aria2 = aria2p.API(
     aria2p.Client(
-        host=server,
-        port=port,
-        secret=secret
+        host=cfg.server,
+        port=cfg.port,
+        secret=cfg.secret
     )
 )
 
-autodl = automateddl.AutomatedDL(aria2, downloaddir, extractdir, endeddir)
+autodl = automateddl.AutomatedDL(aria2, cfg.downloaddir, cfg.extractdir, cfg.endeddir)
 
 def signal_handler(sig, frame):
     autodl.stop()
     sys.exit(0)
 
+# SIGTERM too, so `docker stop` shuts down cleanly instead of waiting
+# out the grace period
 signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)
 
 autodl.start()
+
+if hasattr(signal, 'pause'):
+    # park the main thread without polling or an Event object
+    while True:
+        signal.pause()
+else:
+    import threading
+    threading.Event().wait()
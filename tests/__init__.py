@@ -9,6 +9,9 @@ CONFIGS_DIR = TESTS_DATA_DIR / "configs"
 SESSIONS_DIR = TESTS_DATA_DIR / "sessions"
 STATIC_DIR = TESTS_DATA_DIR / "static"
 
+# reference content asserted by the extraction tests, read once
+EXPECTED_SIMPLE_TXT = (STATIC_DIR / "simple.txt").read_text()
+
 BUNSENLABS_TORRENT = TESTS_DATA_DIR / "bunsenlabs-helium-4.iso.torrent"
 BUNSENLABS_MAGNET = "magnet:?xt=urn:btih:7fb1b254fdbdd8863d686c7fa61b3b0b671551b1&dn=bl-Helium-4-amd64.iso"
 DEBIAN_METALINK = TESTS_DATA_DIR / "debian.metalink"
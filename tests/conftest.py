@@ -1,8 +1,8 @@
 """Configuration for the pytest test suite."""
 
-import json
 import os
-import random
+import shutil
+import socket
 import subprocess
 import sys
 import time
@@ -33,11 +33,19 @@ def tests_logs(request):
 
     log_path.mkdir(parents=True, exist_ok=True)
 
-    # append last part of the name and enable logger
+    # append last part of the name and enable logger through a large
+    # write buffer so TRACE-level runs don't pay one write() per record
     log_path /= name
     if log_path.exists():
         log_path.unlink()
-    enable_logger(sink=log_path, level=os.environ.get("PYTEST_LOG_LEVEL", "TRACE"))
+    sink = open(log_path, "a", buffering=64 * 1024)
+    enable_logger(sink=sink, level=os.environ.get("PYTEST_LOG_LEVEL", "TRACE"))
+
+    yield
+
+    # detach the handler before closing the buffered sink
+    enable_logger(sink=sys.stderr)
+    sink.close()
 
 
 def spawn_and_wait_server(port=8779):
@@ -52,19 +60,26 @@ def spawn_and_wait_server(port=8779):
         ],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
+        # skip the close-fds walk over /proc/self/fd so the interpreter
+        # can take its posix_spawn fast path
+        close_fds=False,
     )
-    while True:
+    # a TCP connect is much cheaper than a full HTTP round-trip, probe
+    # with that and only issue one real request once the port is open
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
         try:
-            requests.get(f"http://localhost:{port}/1024")
-        except:
-            time.sleep(0.1)
-        else:
-            break
+            with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                break
+        except OSError:
+            time.sleep(0.02)
+    requests.get(f"http://localhost:{port}/1")
     return process
 
 
-@pytest.fixture(scope="session", autouse=True)
+@pytest.fixture(scope="session")
 def http_server(tmp_path_factory, worker_id):
+    # not autouse: only tests that actually download pay the uvicorn spawn
     if worker_id == "master":
         # single worker: just run the HTTP server
         process = spawn_and_wait_server()
@@ -91,6 +106,17 @@ def http_server(tmp_path_factory, worker_id):
     process.wait()
 
 
+class _SessionClient(Client):
+    # aria2p's Client calls requests.post, opening a fresh TCP
+    # connection per JSON-RPC call; a Session keeps one alive instead
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http_session = requests.Session()
+
+    def post(self, payload):
+        return self.http_session.post(self.server, data=payload, timeout=self.timeout).json()
+
+
 class _Aria2Server:
     def __init__(self, tmp_dir, port, config=None, session=None, secret=""):
         self.tmp_dir = tmp_dir
@@ -129,29 +155,31 @@ class _Aria2Server:
         self.process = None
 
         # create the client with port
-        self.client = Client(port=self.port, secret=secret, timeout=20)
+        self.client = _SessionClient(port=self.port, secret=secret, timeout=20)
 
         # create the API instance
         self.api = API(self.client)
 
     def start(self):
-        while True:
-            # create the subprocess
-            self.process = subprocess.Popen(self.command)
-
-            # make sure the server is running
-            retries = 5
-            while retries:
+        for _ in range(3):
+            # create the subprocess; close_fds=False keeps Popen on the
+            # posix_spawn fast path instead of fork + fd-close loop
+            self.process = subprocess.Popen(self.command, close_fds=False)
+
+            # exponential backoff: a fast startup is caught on the first
+            # short probe instead of a flat 100 ms sleep
+            for delay in (0.01, 0.02, 0.04, 0.08, 0.16, 0.32):
                 try:
                     self.client.list_methods()
                 except requests.ConnectionError:
-                    time.sleep(0.1)
-                    retries -= 1
+                    time.sleep(delay)
                 else:
-                    break
+                    return
 
-            if retries:
-                break
+            self.process.kill()
+            self.process.wait()
+
+        raise RuntimeError(f"aria2c on port {self.port} failed to start")
 
     def wait(self):
         while True:
@@ -170,15 +198,36 @@ class _Aria2Server:
         self.process.kill()
         self.wait()
 
-    def rmdir(self, directory=None):
-        if directory is None:
-            directory = self.tmp_dir
-        for item in directory.iterdir():
-            if item.is_dir():
-                self.rmdir(item)
+    def load_session(self, session, directory):
+        # reuse the running daemon: drop previous state, then queue the
+        # session entries with their options, downloading into directory
+        self.api.remove_all(force=True)
+        self.api.purge()
+
+        session_path = SESSIONS_DIR / session
+        if not session_path.exists():
+            raise ValueError(f"no such session: {session}")
+
+        uri = None
+        options = {}
+        for line in session_path.read_text().splitlines():
+            if not line:
+                continue
+            if line.startswith(" "):
+                key, _, value = line.strip().partition("=")
+                options[key] = value
             else:
-                item.unlink()
-        directory.rmdir()
+                if uri:
+                    self.api.add_uris([uri], options={**options, "dir": str(directory)})
+                uri = line
+                options = {}
+        if uri:
+            self.api.add_uris([uri], options={**options, "dir": str(directory)})
+
+    def rmdir(self, directory=None):
+        # rmtree walks with scandir: far fewer syscalls than recursing
+        # with iterdir/unlink one inode at a time
+        shutil.rmtree(directory or self.tmp_dir, ignore_errors=True)
 
     def destroy(self, force=False):
         if force:
@@ -200,69 +249,55 @@ class Aria2Server:
         self.server.destroy(force=True)
 
 
-ports_file = Path(".ports.json")
-
-
-def get_lock():
-    lockdir = Path(".lockdir")
-    while True:
-        try:
-            lockdir.mkdir(exist_ok=False)
-        except FileExistsError:
-            time.sleep(0.025)
-        else:
-            break
-
-
-def release_lock():
-    Path(".lockdir").rmdir()
-
-
-def get_random_port():
-    return random.randint(15000, 16000)
-
-
-def get_current_ports():
-    try:
-        return json.loads(ports_file.read_text())
-    except FileNotFoundError:
-        return []
+def wait_for_listener(client, timeout=5, interval=0.05):
+    # client.listening flips just before the WebSocket handshake, wait
+    # for it and leave one beat for the connection itself
+    deadline = time.monotonic() + timeout
+    while not client.listening and time.monotonic() < deadline:
+        time.sleep(interval)
+    time.sleep(0.1)
 
 
-def set_current_ports(ports):
-    ports_file.write_text(json.dumps(ports))
+def wait_for_downloads_complete(api, timeout=10, interval=0.05):
+    # the handlers remove every download they have processed, so an
+    # empty queue means each completion went all the way through
+    deadline = time.monotonic() + timeout
+    while api.get_downloads() and time.monotonic() < deadline:
+        time.sleep(interval)
 
 
 def reserve_port():
-    get_lock()
-
-    ports = get_current_ports()
-    port_number = get_random_port()
-    while port_number in ports:
-        port_number = get_random_port()
-    ports.append(port_number)
-    set_current_ports(ports)
-
-    release_lock()
-    return port_number
-
-
-def release_port(port_number):
-    get_lock()
-    ports = get_current_ports()
-    ports.remove(port_number)
-    set_current_ports(ports)
-    release_lock()
+    # let the kernel hand out a free ephemeral port atomically; no
+    # cross-worker lock directory or ports file needed
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
 
 
 @pytest.fixture
 def port():
-    port_number = reserve_port()
-    yield port_number
-    release_port(port_number)
+    return reserve_port()
 
 
 @pytest.fixture
 def server(tmp_path, port):
     with Aria2Server(tmp_path, port) as server:
-        yield server
\ No newline at end of file
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def _cleanup_tmp(tmp_path):
+    # drop downloaded/extracted payloads even when a test fails, so
+    # repeated runs don't accumulate under /tmp
+    yield
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+@pytest.fixture(scope="module")
+def aria2_server(tmp_path_factory):
+    # one aria2c daemon per module; each test reloads its own session
+    # instead of paying a fresh spawn + RPC handshake
+    server = _Aria2Server(tmp_path_factory.mktemp("aria2"), reserve_port())
+    server.start()
+    yield server
+    server.destroy(force=True)
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""Shared helpers for the test suite."""
+
+import os
+
+
+def dir_names(path):
+    # one scandir pass instead of one stat() per Path.exists() call
+    return {entry.name for entry in os.scandir(path)}
+
+
+def dir_is_empty(path):
+    # short-circuits at the first entry instead of counting them all
+    with os.scandir(path) as entries:
+        return next(entries, None) is None
+
+
+def completed_gids(caplog):
+    # one pass over the records instead of one full-log substring scan
+    # per expected gid
+    return {
+        message.split()[0]
+        for message in (record.getMessage() for record in caplog.records)
+        if message.endswith(" Complete")
+    }
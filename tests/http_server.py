@@ -1,51 +1,77 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.responses import StreamingResponse
 from fastapi.responses import FileResponse
 #from fastapi.staticfiles import StaticFiles
 
 from . import STATIC_DIR
 import os
+from functools import lru_cache
 
 
+_multipliers = {"k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30}
+
+
+@lru_cache(maxsize=128)
 def translate_size(size):
-    try:
+    # path parameters are strings and usually plain digits; tests reuse
+    # the same handful of sizes so the cache absorbs repeat parses
+    if size.isdigit():
         return int(size)
-    except ValueError:
-        pass
     size = size.lower()
-    if size.endswith("k"):
-        multiplier = 2 ** 10
-    elif size.endswith("m"):
-        multiplier = 2 ** 20
-    elif size.endswith("g"):
-        multiplier = 2 ** 30
-    else:
+    multiplier = _multipliers.get(size[-1:])
+    if multiplier is None:
         raise ValueError("size unit not supported:", size)
-    return int(size.rstrip("kmg")) * multiplier
+    return int(size[:-1]) * multiplier
+
+
+_chunkSize = 1 << 16
+_chunk = b"1" * _chunkSize
 
 
-async def virtual_file(size, chunks=4096):
-    while size > 0:
-        yield b"1" * min(size, chunks)
-        size -= chunks
+async def virtual_file(size, chunks=_chunkSize):
+    # one shared immutable buffer instead of re-allocating it per yield
+    buffer = _chunk if chunks == _chunkSize else b"1" * chunks
+    full, tail = divmod(size, chunks)
+    for _ in range(full):
+        yield buffer
+    if tail:
+        yield buffer[:tail]
+
+
+def virtual_response(size):
+    # small bodies in one send; streaming pays an ASGI event per chunk
+    if size <= 1 << 20:
+        body = _chunk[:size] if size <= _chunkSize else b"1" * size
+        return Response(content=body, media_type="application/octet-stream")
+    return StreamingResponse(
+        virtual_file(size),
+        media_type="application/octet-stream",
+    )
 
 
 app = FastAPI()
 
 #app.mount("/static", StaticFiles(directory='./' + str(STATIC_DIR)), name="static")
 
+@lru_cache(maxsize=256)
+def _static_stat(filename):
+    # the static corpus is immutable during a run, stat each file once
+    path = STATIC_DIR / filename
+    try:
+        return path, os.stat(path)
+    except OSError:
+        return path, None
+
+
 @app.get("/static/{filename}")
 async def static(filename):
-    if os.path.isfile(STATIC_DIR / filename):
-        return FileResponse(STATIC_DIR / filename)
-    return StreamingResponse(
-        virtual_file(translate_size(10)),
-        media_type="application/octet-stream",
-    )
+    path, st = _static_stat(filename)
+    if st is not None:
+        # a precomputed stat_result skips FileResponse's own stat call
+        return FileResponse(path, stat_result=st)
+    return virtual_response(translate_size("10"))
 
 @app.get("/{size}")
 async def get(size):
-    return StreamingResponse(
-        virtual_file(translate_size(size)),
-        media_type="application/octet-stream",
-    )
\ No newline at end of file
+    return virtual_response(translate_size(size))
\ No newline at end of file
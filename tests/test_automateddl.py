@@ -1,350 +1,207 @@
 """Tests for the `automateddl` module."""
 
-import threading
-import time
-import os.path
-import pathlib
-import shutil
+import logging
+import os
+from dataclasses import dataclass
 
 import pytest
 
-from . import CONFIGS_DIR, STATIC_DIR
-from .conftest import Aria2Server
+from . import EXPECTED_SIMPLE_TXT
+from .conftest import wait_for_downloads_complete, wait_for_listener
+from .helpers import completed_gids, dir_is_empty, dir_names
 
 from src.automateddl import AutomatedDL
 
 
-def test_nfo_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="very-small-download-nfo.txt") as server:
+@dataclass
+class DLCase:
+    session: str
+    filename: str
+    extracted: bool = False  # archive scenarios end in an -OUT dir
+    kept: bool = True        # nfo downloads are removed outright
 
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
 
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
+CASES = [
+    DLCase("very-small-download-nfo.txt", "100.nfo", kept=False),
+    DLCase("very-small-download.txt", "100.txt"),
+    DLCase("zip.txt", "simple.zip", extracted=True),
+    DLCase("rar.txt", "simple.rar", extracted=True),
+]
 
-        time.sleep(1)
 
-        server.api.resume_all()
-        time.sleep(1)
+@pytest.mark.parametrize("case", CASES, ids=lambda case: case.filename)
+def test_single_download(tmp_path, aria2_server, http_server, case, caplog):
+    caplog.set_level(logging.INFO)
 
-        autodl.stop()
+    server = aria2_server
+    server.load_session(case.session, tmp_path)
+    extractPath = tmp_path / 'Extract'
+    endedPath = tmp_path / 'Ended'
 
-        download = server.api.get_downloads()
+    autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
+    autodl.start()
+    wait_for_listener(server.client)
 
-        source = pathlib.Path(os.path.join(tmp_path, '100.nfo'))
-        target = pathlib.Path(os.path.join(endedPath, source.name))
+    server.api.resume_all()
+    wait_for_downloads_complete(server.api)
 
-        assert not source.exists()
-        assert not target.exists()
-        assert len(download) == 0
+    autodl.stop()
 
-        assert "0000000000000001 Complete" in capsys.readouterr().out
+    download = server.api.get_downloads()
 
-def test_txt_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="very-small-download.txt") as server:
+    source = tmp_path / case.filename
 
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
+    assert not source.exists() # origin file is deleted
+    assert len(download) == 0 # No remaining download
+    assert "0000000000000001" in completed_gids(caplog)
 
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
-
-        time.sleep(1)
-
-        server.api.resume_all()
-        
-
-        time.sleep(1)
-
-        autodl.stop()
-
-        download = server.api.get_downloads()
-
-        source = pathlib.Path(os.path.join(tmp_path, '100.txt'))
-        target = pathlib.Path(os.path.join(endedPath, source.name))
-
-        assert not source.exists()
-        assert target.exists()
-        assert len(download) == 0
-
-        assert "0000000000000001 Complete" in capsys.readouterr().out
-
-def test_zip_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="zip.txt") as server:
-
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
-
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
-
-        time.sleep(1)
-
-        server.api.resume_all()
-        
-
-        time.sleep(1)
-
-        autodl.stop()
-
-        download = server.api.get_downloads()
-
-        filename = 'simple.zip'
-
-        source = pathlib.Path(os.path.join(tmp_path, filename))
-
-        extract = pathlib.Path(extractPath)
-
-        target = pathlib.Path(os.path.join(endedPath, source.name+autodl.outSuffix))
-
-        assert not source.exists() # origin file is deleted
-        assert len([path for path in extract.iterdir()]) == 0 # extract dir is empty
+    if case.extracted:
+        target = endedPath / (case.filename+autodl.outSuffix)
+        assert dir_is_empty(extractPath) # extract dir is empty
         assert target.exists() and target.is_dir() # target dir exist
-
-        destFileName = 'simple.txt'
-
         # dst file is the same
-        with open(os.path.join(target, destFileName)) as source_cstream:
-            with open(os.path.join(STATIC_DIR, destFileName)) as target_stream:
-                source_contents = source_cstream.read()
-                target_contents = target_stream.read()
-                assert source_contents == target_contents
-
-        assert len(download) == 0 # No remaining download
+        assert target.joinpath('simple.txt').read_text() == EXPECTED_SIMPLE_TXT
+    elif case.kept:
+        assert (endedPath / case.filename).exists()
+    else:
+        assert not (endedPath / case.filename).exists()
 
-        assert "0000000000000001 Complete" in capsys.readouterr().out
+def test_multi_dl(tmp_path, aria2_server, http_server, caplog):
+    caplog.set_level(logging.INFO)
 
-def test_rar_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="rar.txt") as server:
+    server = aria2_server
+    server.load_session("multi-rar.txt", tmp_path)
+    extractPath = tmp_path / 'Extract'
+    endedPath = tmp_path / 'Ended'
 
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
+    autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
+    autodl.start()
+    wait_for_listener(server.client)
 
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
+    server.api.resume_all()
+    
 
-        time.sleep(1)
+    wait_for_downloads_complete(server.api)
 
-        server.api.resume_all()
-        
+    autodl.stop()
 
-        time.sleep(1)
+    download = server.api.get_downloads()
 
-        autodl.stop()
+    filename1 = 'multi.part1.rar'
+    filename2 = 'multi.part2.rar'
+    filename3 = 'multi.part3.rar'
+    filename4 = 'multi.part4.rar'
 
-        download = server.api.get_downloads()
+    target = endedPath / ("multi"+autodl.outSuffix)
 
-        filename = 'simple.rar'
+    present = dir_names(tmp_path)
+    assert filename1 not in present and filename2 not in present and filename3 not in present and filename4 not in present # origin file is deleted
+    assert dir_is_empty(extractPath) # extract dir is empty
+    assert target.exists() and target.is_dir() # target dir exist
 
-        source = pathlib.Path(os.path.join(tmp_path, filename))
+    destFileName = 'simple.txt'
 
-        extract = pathlib.Path(extractPath)
+    # dst file is the same
+    assert target.joinpath(destFileName).read_text() == EXPECTED_SIMPLE_TXT
 
-        target = pathlib.Path(os.path.join(endedPath, source.name+autodl.outSuffix))
+    assert len(download) == 0 # No remaining download
 
-        assert not source.exists() # origin file is deleted
-        assert len([path for path in extract.iterdir()]) == 0 # extract dir is empty
-        assert target.exists() and target.is_dir() # target dir exist
-
-        destFileName = 'simple.txt'
-
-        # dst file is the same
-        with open(os.path.join(target, destFileName)) as source_cstream:
-            with open(os.path.join(STATIC_DIR, destFileName)) as target_stream:
-                source_contents = source_cstream.read()
-                target_contents = target_stream.read()
-                assert source_contents == target_contents
+    assert {"0000000000000001", "0000000000000002", "0000000000000003", "0000000000000004"} <= completed_gids(caplog)
 
-        assert len(download) == 0 # No remaining download
+def test_missing_dl(tmp_path, aria2_server, http_server, caplog):
+    caplog.set_level(logging.INFO)
 
-        assert "0000000000000001 Complete" in capsys.readouterr().out
+    server = aria2_server
+    server.load_session("multi-rar-missing.txt", tmp_path)
+    extractPath = tmp_path / 'Extract'
+    endedPath = tmp_path / 'Ended'
 
-def test_multi_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="multi-rar.txt") as server:
+    autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
+    autodl.start()
+    wait_for_listener(server.client)
 
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
+    server.api.resume_all()
+    
+    wait_for_downloads_complete(server.api)
 
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
+    autodl.stop()
 
-        time.sleep(1)
+    download = server.api.get_downloads()
 
-        server.api.resume_all()
-        
+    filename1 = 'multi.part1.rar'
+    filename2 = 'multi.part2.rar'
+    filename3 = 'multi.part3.rar'
+    filename4 = 'multi.part4.rar'
 
-        time.sleep(1)
+    target = endedPath / ("multi"+autodl.outSuffix)
 
-        autodl.stop()
+    present = dir_names(tmp_path)
+    assert filename1 in present and filename2 not in present and filename3 in present and filename4 not in present # origin file is deleted
+    # the failed extraction leaves exactly the staged output dir behind
+    entries = list(os.scandir(extractPath))
+    assert len(entries) == 1 and entries[0].name == "multi"+autodl.outSuffix
+    
+    assert not target.exists() # target dir not exist
 
-        download = server.api.get_downloads()
+    assert len(download) == 0 # No remaining download
 
-        filename1 = 'multi.part1.rar'
-        filename2 = 'multi.part2.rar'
-        filename3 = 'multi.part3.rar'
-        filename4 = 'multi.part4.rar'
+    assert {"0000000000000001", "0000000000000003"} <= completed_gids(caplog)
+    
+def test_all_dl(tmp_path, aria2_server, http_server, caplog):
+    caplog.set_level(logging.INFO)
 
-        source1 = pathlib.Path(os.path.join(tmp_path, filename1))
-        source2 = pathlib.Path(os.path.join(tmp_path, filename2))
-        source3 = pathlib.Path(os.path.join(tmp_path, filename3))
-        source4 = pathlib.Path(os.path.join(tmp_path, filename4))
+    server = aria2_server
+    server.load_session("all.txt", tmp_path)
+    extractPath = tmp_path / 'Extract'
+    endedPath = tmp_path / 'Ended'
 
-        extract = pathlib.Path(extractPath)
+    autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
+    autodl.start()
+    wait_for_listener(server.client)
 
-        target = pathlib.Path(os.path.join(endedPath, "multi"+autodl.outSuffix))
+    server.api.resume_all()
+    
 
-        assert not source1.exists() and not source2.exists() and not source3.exists() and not source4.exists() # origin file is deleted
-        assert len([path for path in extract.iterdir()]) == 0 # extract dir is empty
-        assert target.exists() and target.is_dir() # target dir exist
-
-        destFileName = 'simple.txt'
-
-        # dst file is the same
-        with open(os.path.join(target, destFileName)) as source_cstream:
-            with open(os.path.join(STATIC_DIR, destFileName)) as target_stream:
-                source_contents = source_cstream.read()
-                target_contents = target_stream.read()
-                assert source_contents == target_contents
+    wait_for_downloads_complete(server.api)
 
-        assert len(download) == 0 # No remaining download
+    autodl.stop()
 
-        outvalue = capsys.readouterr().out
+    download = server.api.get_downloads()
 
-        assert "0000000000000001 Complete" in outvalue
-        assert "0000000000000002 Complete" in outvalue
-        assert "0000000000000003 Complete" in outvalue
-        assert "0000000000000004 Complete" in outvalue
+    filename1 = 'multi.part1.rar'
+    filename2 = 'multi.part2.rar'
+    filename3 = 'multi.part3.rar'
+    filename4 = 'multi.part4.rar'
+    filename5 = 'simple.rar'
+    filename6 = 'simple.zip'
+    filename7 = '100.txt'
 
-def test_missing_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="multi-rar-missing.txt") as server:
+    target1 = endedPath / ("multi"+autodl.outSuffix)
 
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
+    target5 = endedPath / (filename5+autodl.outSuffix)
+    target6 = endedPath / (filename6+autodl.outSuffix)
+    target7 = endedPath / filename7
 
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
+    present = dir_names(tmp_path)
+    for name in (filename1, filename2, filename3, filename4, filename5, filename6, filename7):
+        assert name not in present # origin file is deleted
 
-        time.sleep(1)
-
-        server.api.resume_all()
-        
-        time.sleep(1)
-
-        autodl.stop()
-
-        download = server.api.get_downloads()
-
-        filename1 = 'multi.part1.rar'
-        filename2 = 'multi.part2.rar'
-        filename3 = 'multi.part3.rar'
-        filename4 = 'multi.part4.rar'
-
-        source1 = pathlib.Path(os.path.join(tmp_path, filename1))
-        source2 = pathlib.Path(os.path.join(tmp_path, filename2))
-        source3 = pathlib.Path(os.path.join(tmp_path, filename3))
-        source4 = pathlib.Path(os.path.join(tmp_path, filename4))
-
-        extract = pathlib.Path(extractPath)
-
-        target = pathlib.Path(os.path.join(endedPath, "multi"+autodl.outSuffix))
-
-        assert source1.exists() and not source2.exists() and source3.exists() and not source4.exists() # origin file is deleted
-        assert len([path for path in extract.iterdir()]) == 1 # extract dir is empty
-
-        assert extract.joinpath("multi"+autodl.outSuffix).exists()
-        
-        assert not target.exists() # target dir not exist
-
-        assert len(download) == 0 # No remaining download
-
-        outvalue = capsys.readouterr().out
-
-        assert "0000000000000001 Complete" in outvalue
-        assert "0000000000000003 Complete" in outvalue
-        
-def test_all_dl(tmp_path, port, capsys):
-    with Aria2Server(tmp_path, port, session="all.txt") as server:
-
-        extractPath = os.path.join(tmp_path, 'Extract')
-        endedPath = os.path.join(tmp_path, 'Ended')
-
-        autodl = AutomatedDL(server.api, tmp_path, extractPath, endedPath)
-        autodl.start()
-
-        time.sleep(1)
-
-        server.api.resume_all()
-        
-
-        time.sleep(1)
-
-        autodl.stop()
-
-        download = server.api.get_downloads()
-
-        filename1 = 'multi.part1.rar'
-        filename2 = 'multi.part2.rar'
-        filename3 = 'multi.part3.rar'
-        filename4 = 'multi.part4.rar'
-        filename5 = 'simple.rar'
-        filename6 = 'simple.zip'
-        filename7 = '100.txt'
-
-        source1 = pathlib.Path(os.path.join(tmp_path, filename1))
-        source2 = pathlib.Path(os.path.join(tmp_path, filename2))
-        source3 = pathlib.Path(os.path.join(tmp_path, filename3))
-        source4 = pathlib.Path(os.path.join(tmp_path, filename4))
-
-        source5 = pathlib.Path(os.path.join(tmp_path, filename5))
-        source6 = pathlib.Path(os.path.join(tmp_path, filename6))
-        source7 = pathlib.Path(os.path.join(tmp_path, filename7))
-
-        extract = pathlib.Path(extractPath)
-
-        target1 = pathlib.Path(os.path.join(endedPath, "multi"+autodl.outSuffix))
-
-        target5 = pathlib.Path(os.path.join(endedPath, source5.name+autodl.outSuffix))
-        target6 = pathlib.Path(os.path.join(endedPath, source6.name+autodl.outSuffix))
-        target7 = pathlib.Path(os.path.join(endedPath, source7.name))
-
-        assert not source1.exists() and not source2.exists() and not source3.exists() and not source4.exists() # origin file is deleted
-        assert not source5.exists() and not source6.exists() and not source7.exists()  # origin file is deleted
-        
-        assert len([path for path in extract.iterdir()]) == 0 # extract dir is empty
-        assert target1.exists() and target1.is_dir() # target dir exist
-
-        assert target5.exists() and target5.is_dir() # target dir exist
-        assert target6.exists() and target6.is_dir() # target dir exist
-
-        assert target7.exists() and target7.is_file() # target dir exist
-
-        destFileName = 'simple.txt'
-
-        # dst file is the same
-        with open(os.path.join(STATIC_DIR, destFileName)) as target_stream:
-            target_contents = target_stream.read()
+    assert dir_is_empty(extractPath) # extract dir is empty
+    assert target1.exists() and target1.is_dir() # target dir exist
 
-            with open(os.path.join(target1, destFileName)) as source_cstream:
-                source_contents = source_cstream.read()
-                assert source_contents == target_contents
+    assert target5.exists() and target5.is_dir() # target dir exist
+    assert target6.exists() and target6.is_dir() # target dir exist
 
-            with open(os.path.join(target5, destFileName)) as source_cstream:
-                source_contents = source_cstream.read()
-                assert source_contents == target_contents
+    assert target7.exists() and target7.is_file() # target dir exist
 
-            with open(os.path.join(target6, destFileName)) as source_cstream:
-                source_contents = source_cstream.read()
-                assert source_contents == target_contents
+    destFileName = 'simple.txt'
 
-        assert len(download) == 0 # No remaining download
+    # dst file is the same
+    assert target1.joinpath(destFileName).read_text() == EXPECTED_SIMPLE_TXT
+    assert target5.joinpath(destFileName).read_text() == EXPECTED_SIMPLE_TXT
+    assert target6.joinpath(destFileName).read_text() == EXPECTED_SIMPLE_TXT
 
-        outvalue = capsys.readouterr().out
+    assert len(download) == 0 # No remaining download
 
-        assert "0000000000000001 Complete" in outvalue
-        assert "0000000000000002 Complete" in outvalue
-        assert "0000000000000003 Complete" in outvalue
-        assert "0000000000000004 Complete" in outvalue
-        assert "0000000000000005 Complete" in outvalue
-        assert "0000000000000006 Complete" in outvalue
-        assert "0000000000000007 Complete" in outvalue
\ No newline at end of file
+    expected = {f"{gid:016d}" for gid in range(1, 8)}
+    assert expected <= completed_gids(caplog)
\ No newline at end of file